@@ -8,16 +8,21 @@ Port to bleak/asyncio is based on pySwitchbot
 from __future__ import annotations
 
 import asyncio
+import functools
 import logging
+import operator
 import struct
+from typing import Callable
 
 from bleak import BleakError
 from bleak import BleakClient
+from bleak.backends.characteristic import BleakGATTCharacteristic
 from bleak.backends.device import BLEDevice
 from bleak_retry_connector import establish_connection
 
 _LOGGER = logging.getLogger(__name__)
 
+COMETBLUE_SERVICE = "47e9ee00-47e9-11e4-8939-164230d1df67"  # advertised primary service
 PASSWORD_CHAR = "47e9ee30-47e9-11e4-8939-164230d1df67"
 TEMPERATURE_CHAR = "47e9ee2b-47e9-11e4-8939-164230d1df67"
 BATTERY_CHAR = "47e9ee2c-47e9-11e4-8939-164230d1df67"
@@ -32,26 +37,45 @@ FIRMWARE_CHAR = "47e9ee2d-47e9-11e4-8939-164230d1df67"  # firmware_revision2 (CO
 _PIN_STRUCT_PACKING = '<I'
 _DATETIME_STRUCT_PACKING = '<BBBBB'
 _DAY_STRUCT_PACKING = '<BBBBBBBB'
+_PIN_STRUCT = struct.Struct(_PIN_STRUCT_PACKING)
+_DATETIME_STRUCT = struct.Struct(_DATETIME_STRUCT_PACKING)
+_TEMPERATURES_STRUCT = struct.Struct('<bbbbbbb')
+# lookup tables for decoding raw temperature bytes (signed, 0.5 degree steps)
+_SIGNED_TABLE = tuple(b - 256 if b >= 128 else b for b in range(256))
+_HALF_TABLE_SIGNED = tuple(b / 2.0 for b in _SIGNED_TABLE)
+_INVALID_TEMPERATURE_BYTE = 0x80
 DISCONNECT_DELAY = 49
 
 
 def _encode_datetime(dt):
-    if dt.year < 2000:
-        raise RuntimeError('Invalid year')
-    return struct.pack(
-        _DATETIME_STRUCT_PACKING,
-        dt.minute,
-        dt.hour,
-        dt.day,
-        dt.month,
-        dt.year - 2000)
+    # the year is sent as an unsigned byte offset from 2000, struct rejects anything out of range
+    try:
+        return _DATETIME_STRUCT.pack(
+            dt.minute,
+            dt.hour,
+            dt.day,
+            dt.month,
+            dt.year - 2000)
+    except struct.error as e:
+        raise RuntimeError('Invalid datetime') from e
+
+
+def _float_to_int(value):
+    """Encode float for CometBlue update, returns value * 2.0, if value is set, else -128"""
+    return -128 if value is None else int(value * 2.0)
+
+
+def _int_to_int(value):
+    """Encode int for CometBlue update, returns value, if value is set, else -128"""
+    return -128 if value is None else int(value)
 
 
 class CometBlueStates:
     """CometBlue Thermostat States"""
+    __slots__ = ('is_off', 'firmware_rev', 'manufacturer', 'model', 'name', 'software_rev', '_status_dword',
+                 '_status_touched', '_battery_level', '_current_temp', 'target_temperature', 'target_temp_l',
+                 'target_temp_h', 'offset_temperature', 'window_open_detection', 'window_open_minutes')
     TEMPERATURE_OFF = 7.5  # special temperature, valve fully closed
-    _TEMPERATURES_STRUCT_PACKING = '<bbbbbbb'
-    _STATUS_STRUCT_PACKING = '<BBB'
 
     _STATUS_BITMASKS = {
         'childlock': 0x80,
@@ -65,6 +89,20 @@ class CometBlueStates:
         'low_battery': 0x800,
         'unknown': 0x2000
     }
+    # 'installing' combines the adapting, not_ready and motor_moving bits, so it has to be checked first
+    _STATUS_PRIORITY = (
+        ('installing', _STATUS_BITMASKS['installing']),
+        ('adapting', _STATUS_BITMASKS['adapting']),
+        ('not_ready', _STATUS_BITMASKS['not_ready']),
+        ('motor_moving', _STATUS_BITMASKS['motor_moving']),
+        ('satisfied', _STATUS_BITMASKS['satisfied']),
+        ('unknown', _STATUS_BITMASKS['unknown']),
+    )
+    _STATUS_MASKED_OUT = functools.reduce(operator.or_, _STATUS_BITMASKS.values())
+    _CHILDLOCK_MASK = _STATUS_BITMASKS['childlock']
+    _MANUAL_MODE_MASK = _STATUS_BITMASKS['manual_mode']
+    _LOW_BATTERY_MASK = _STATUS_BITMASKS['low_battery']
+    _ANTIFROST_ACTIVATED_MASK = _STATUS_BITMASKS['antifrost_activated']
 
     def __init__(self):
         self.is_off = False
@@ -73,7 +111,10 @@ class CometBlueStates:
         self.model = None
         self.name = None
         self.software_rev = None
-        self._status = dict()
+        # packed status bits as sent by the device, None if unknown / nothing to write
+        self._status_dword: int | None = None
+        # bits explicitly set or cleared through the properties, all bits if status_code was assigned
+        self._status_touched = 0
         self._battery_level = None
         self._current_temp = None
         self.target_temperature = None
@@ -91,173 +132,201 @@ class CometBlueStates:
         self.window_open_detection = None
         self.window_open_minutes = None
 
+    def _get_status(self, mask):
+        # only used with single-bit masks, composite masks are handled in status
+        status_dword = self._status_dword
+        return status_dword is not None and bool(status_dword & mask)
+
+    def _set_status(self, mask, value):
+        status_dword = self._status_dword or 0
+        self._status_dword = status_dword | mask if value else status_dword & ~mask
+        self._status_touched |= mask
+
     @property
     def battery_level(self):
         return self._battery_level
 
     @battery_level.setter
     def battery_level(self, value):
-        self._battery_level = ord(value)
+        self._battery_level = value[0]
 
     @property
     def locked(self):
-        return self._status.get('childlock', False)
+        return self._get_status(CometBlueStates._CHILDLOCK_MASK)
 
     @locked.setter
     def locked(self, value):
-        self._status['childlock'] = value
+        self._set_status(CometBlueStates._CHILDLOCK_MASK, value)
 
     @property
     def manual_mode(self):
-        return self._status.get('manual_mode', False)
+        return self._get_status(CometBlueStates._MANUAL_MODE_MASK)
 
     @manual_mode.setter
     def manual_mode(self, value):
-        self._status['manual_mode'] = value
+        self._set_status(CometBlueStates._MANUAL_MODE_MASK, value)
 
     @property
     def low_battery(self):
-        return self._status.get('low_battery', False)
+        return self._get_status(CometBlueStates._LOW_BATTERY_MASK)
 
     @low_battery.setter
     def low_battery(self, value):
-        self._status['low_battery'] = value
+        self._set_status(CometBlueStates._LOW_BATTERY_MASK, value)
 
     @property
     def status(self):
-        actions = ['adapting', 'not_ready', 'installing', 'motor_moving', 'unknown', 'satisfied']
-        active_actions = [k for k, v in self._status.items() if v is True and k in actions]
-
-        return active_actions.pop(0) if active_actions else 'unknown'
+        status_dword = self._status_dword
+        if status_dword is not None:
+            for action, mask in CometBlueStates._STATUS_PRIORITY:
+                if status_dword & mask == mask:
+                    return action
+        return 'unknown'
 
     @property
     def temperature(self):
         """Current temperature, adjusted by offset temperature"""
         if self._current_temp is not None:
-            offset_temp = getattr(self, 'offset_temperature', 0.0)
-            return self._current_temp + offset_temp
+            offset_temp = self.offset_temperature
+            return self._current_temp + (offset_temp if offset_temp is not None else 0.0)
 
     @property
     def window_open(self):
-        return self._status.get('antifrost_activated', False)
+        return self._get_status(CometBlueStates._ANTIFROST_ACTIVATED_MASK)
 
     @window_open.setter
     def window_open(self, value):
-        self._status['antifrost_activated'] = value
+        self._set_status(CometBlueStates._ANTIFROST_ACTIVATED_MASK, value)
 
     @property
-    def status_code(self):
-        def encode_status(value):
-            status_dword = 0
-            for key, state in value.items():
-                if not state:
-                    continue
-                if key not in CometBlueStates._STATUS_BITMASKS:
-                    continue
-                status_dword |= CometBlueStates._STATUS_BITMASKS[key]
-            value = struct.pack('<I', status_dword)
-            # downcast to 3 bytes
-            return struct.pack(CometBlueStates._STATUS_STRUCT_PACKING, *[int(byte) for byte in value[:3]])
+    def has_pending_status(self):
+        """True if a status write is pending (possibly all bits cleared), without encoding it"""
+        return self._status_dword is not None
 
+    @property
+    def status_code(self):
         # check for changed status_code with 'is not None'
-        if len(self._status) == 0:
+        status_dword = self._status_dword
+        if status_dword is None:
             return None
-        else:
-            _LOGGER.debug("Updating Status to %s", self._status)
-            return encode_status(self._status)
+        # downcast to 3 bytes
+        return (status_dword & 0xFFFFFF).to_bytes(3, 'little')
 
     @status_code.setter
     def status_code(self, val):
-        def decode_status(value):
-            state_dword = struct.unpack('<I', value + b'\x00')[0]
-
-            report = {}
-            masked_out = 0
-            for key, mask in CometBlueStates._STATUS_BITMASKS.items():
-                report[key] = bool(state_dword & mask == mask)
-                masked_out |= mask
+        self._status_dword = None if val is None else int.from_bytes(val, 'little')
+        self._status_touched = 0 if val is None else 0xFFFFFF
 
-            report['state_as_dword'] = state_dword
-            report['unused_bits'] = state_dword & ~masked_out
-
-            return report
+    @property
+    def state_as_dword(self):
+        """Raw status bits as reported by the device (debugging aid)"""
+        return self._status_dword
 
-        if val is None:
-            self._status = dict()
-        else:
-            self._status = decode_status(val)
+    @property
+    def unused_bits(self):
+        """Status bits not covered by any known bitmask (debugging aid)"""
+        if self._status_dword is not None:
+            return self._status_dword & ~CometBlueStates._STATUS_MASKED_OUT
 
     @property
     def temperatures(self):
-        def float_to_int(value):
-            """Encode float for CometBlue update, returns value * 2.0, if value is set, else -128"""
-            return -128 if value is None else int(value * 2.0)
-
-        def int_to_int(value):
-            """Encode float for CometBlue update, returns value, if value is set, else -128"""
-            return -128 if value is None else int(value)
-
-        temps = {
-            'current_temp': -128,  # current temp
-            'manual_temp': float_to_int(self.target_temperature),
-            'target_temp_l': float_to_int(self.target_temp_l),
-            'target_temp_h': float_to_int(self.target_temp_h),
-            'offset_temp': float_to_int(self.offset_temperature),
-            'window_open_detection': int_to_int(self.window_open_detection),
-            'window_open_minutes': int_to_int(self.window_open_minutes),
-        }
-        _LOGGER.debug("Updating Temperatures to {}".format(temps))
-
-        data = struct.pack(
-            CometBlueStates._TEMPERATURES_STRUCT_PACKING,
-            *temps.values(),
-        )
-        return data
+        manual_temp = _float_to_int(self.target_temperature)
+        target_low = _float_to_int(self.target_temp_l)
+        target_high = _float_to_int(self.target_temp_h)
+        offset_temp = _float_to_int(self.offset_temperature)
+        window_open_detect = _int_to_int(self.window_open_detection)
+        window_open_minutes = _int_to_int(self.window_open_minutes)
+
+        if _LOGGER.isEnabledFor(logging.DEBUG):
+            temps = {
+                'current_temp': -128,  # current temp
+                'manual_temp': manual_temp,
+                'target_temp_l': target_low,
+                'target_temp_h': target_high,
+                'offset_temp': offset_temp,
+                'window_open_detection': window_open_detect,
+                'window_open_minutes': window_open_minutes,
+            }
+            _LOGGER.debug("Updating Temperatures to %r", temps)
+
+        # current temp is always sent as -128 (unchanged), struct rejects values outside the signed byte range
+        return _TEMPERATURES_STRUCT.pack(-128, manual_temp, target_low, target_high, offset_temp,
+                                         window_open_detect, window_open_minutes)
 
     @temperatures.setter
     def temperatures(self, value):
-        temps = struct.unpack(CometBlueStates._TEMPERATURES_STRUCT_PACKING, value)
-        current_temp, manual_temp, target_low, target_high, offset_temp, window_open_detect, window_open_minutes = temps
+        # same error as the former struct.unpack, raised before any state is touched
+        if len(value) != _TEMPERATURES_STRUCT.size:
+            raise struct.error('unpack requires a buffer of %d bytes' % _TEMPERATURES_STRUCT.size)
 
-        # abort on any invalid temperature value
-        if -128 in temps:
-            _LOGGER.debug("Got invalid Temperatures: {}".format(temps))
+        # abort on any invalid temperature value (-128 as signed byte)
+        if _INVALID_TEMPERATURE_BYTE in value:
+            _LOGGER.debug("Got invalid Temperatures: %r", value)
             return
 
+        half = _HALF_TABLE_SIGNED
+        manual_temp = half[value[1]]
+
         # preserve current "target_temperature" when TEMPERATURE_OFF is active
-        if manual_temp / 2.0 == CometBlueStates.TEMPERATURE_OFF:
+        if manual_temp == CometBlueStates.TEMPERATURE_OFF:
             self.is_off = True
         else:
             self.is_off = False
-            self.target_temperature = manual_temp / 2.0
+            self.target_temperature = manual_temp
 
-        self._current_temp = current_temp / 2.0
-        self.target_temp_l = target_low / 2.0
-        self.target_temp_h = target_high / 2.0
-        self.offset_temperature = offset_temp / 2.0
-        self.window_open_detection = window_open_detect
-        self.window_open_minutes = window_open_minutes
+        self._current_temp = half[value[0]]
+        self.target_temp_l = half[value[2]]
+        self.target_temp_h = half[value[3]]
+        self.offset_temperature = half[value[4]]
+        self.window_open_detection = _SIGNED_TABLE[value[5]]
+        self.window_open_minutes = _SIGNED_TABLE[value[6]]
 
-        _LOGGER.debug("Got Temperatures: {}".format(temps))
+        _LOGGER.debug("Got Temperatures: %r", value)
 
     @property
     def all_temperatures_none(self):
-        """True if any of the temperature properties is not None"""
-        values = {self.target_temperature, self.target_temp_l, self.target_temp_h, self.offset_temperature, self.window_open_detection,
-                  self.window_open_minutes}
-        values.remove(None)
-        return len(values) == 0
+        """True if none of the temperature properties is set"""
+        return (self.target_temperature is None and self.target_temp_l is None and self.target_temp_h is None
+                and self.offset_temperature is None and self.window_open_detection is None
+                and self.window_open_minutes is None)
+
+    def status_matches(self, other):
+        """True if every status bit set or cleared here has the same value in other"""
+        if self._status_dword is None or other._status_dword is None:
+            return False
+        touched = self._status_touched
+        return self._status_dword & touched == other._status_dword & touched
+
+    def temperatures_match(self, other):
+        """True if every set temperature property equals the value reported by other"""
+        manual_temp = CometBlueStates.TEMPERATURE_OFF if other.is_off else other.target_temperature
+        return all(value is None or value == reported for value, reported in (
+            (self.target_temperature, manual_temp),
+            (self.target_temp_l, other.target_temp_l),
+            (self.target_temp_h, other.target_temp_h),
+            (self.offset_temperature, other.offset_temperature),
+            (self.window_open_detection, other.window_open_detection),
+            (self.window_open_minutes, other.window_open_minutes)))
 
 
 class CometBlue:
     """CometBlue Thermostat """
+    __slots__ = ('_device', '_device_lookup', '_pin', 'available', '_current', '_target',
+                 '_connect_lock', '_operation_lock', '_client', '_disconnect_timer', '_expected_disconnect', '_loop',
+                 '_password_char', '_temperature_char', '_battery_char', '_status_char', '_model_char',
+                 '_firmware_char', '_manufacturer_char', '_software_rev_char')
 
-    def __init__(self, pin):
+    def __init__(self, pin, device_lookup: Callable[[str], BLEDevice | None] | None = None):
+        """
+        pin: PIN of the thermostat
+        device_lookup: optional callable returning the most recently seen BLEDevice for an address
+            (e.g. from an advertisement cache), used to refresh the device between connection attempts
+        """
         super(CometBlue, self).__init__()
         self._device: BLEDevice | None = None
+        self._device_lookup = device_lookup
         self._pin = pin
         self.available = False
-        self._handles = dict()
         self._current = CometBlueStates()
         self._target = CometBlueStates()
         self._connect_lock = asyncio.Lock()
@@ -266,6 +335,15 @@ class CometBlue:
         self._disconnect_timer: asyncio.TimerHandle | None = None
         self._expected_disconnect = False
         self._loop = asyncio.get_event_loop()
+        # characteristics resolved on connect, see _resolve_characteristics()
+        self._password_char: BleakGATTCharacteristic | str | None = None
+        self._temperature_char: BleakGATTCharacteristic | str | None = None
+        self._battery_char: BleakGATTCharacteristic | str | None = None
+        self._status_char: BleakGATTCharacteristic | str | None = None
+        self._model_char: BleakGATTCharacteristic | str | None = None
+        self._firmware_char: BleakGATTCharacteristic | str | None = None
+        self._manufacturer_char: BleakGATTCharacteristic | str | None = None
+        self._software_rev_char: BleakGATTCharacteristic | str | None = None
         # btle.Debugging = True
 
     async def _ensure_connected(self, device: BLEDevice):
@@ -285,24 +363,50 @@ class CometBlue:
                 return
             _LOGGER.debug("%s: Connecting; ", device.address)
             self._device = device
+            kwargs = {}
+            if self._device_lookup:
+                kwargs['ble_device_callback'] = self._lookup_device
             self._client = await establish_connection(
                 BleakClient,
                 self._device,
                 self._device.address,
-                self._disconnected
+                self._disconnected,
+                **kwargs
             )
             _LOGGER.debug("%s: Connected", self._device.address)
+            self._resolve_characteristics()
             # authenticate with PIN and initialize static values
             self._reset_disconnect_timer()
 
-        data = struct.pack(_PIN_STRUCT_PACKING, self._pin)
+        data = _PIN_STRUCT.pack(self._pin)
         try:
-            await self._client.write_gatt_char(PASSWORD_CHAR, data, response=True)
+            await self._client.write_gatt_char(self._password_char, data, response=True)
         except BleakError:
-            _LOGGER.error("provided pin was not accepted by device %s" % self._client.address)
+            _LOGGER.error("provided pin was not accepted by device %s", self._client.address)
 
         _LOGGER.debug("Connected and authenticated with device %s", self._device.address)
 
+    def _resolve_characteristics(self):
+        """Resolve characteristics once per connection instead of on every read/write."""
+        services = self._client.services
+
+        def resolve(uuid):
+            # fall back to the UUID so bleak's error names a characteristic the device does not expose
+            return services.get_characteristic(uuid) or uuid
+
+        self._password_char = resolve(PASSWORD_CHAR)
+        self._temperature_char = resolve(TEMPERATURE_CHAR)
+        self._battery_char = resolve(BATTERY_CHAR)
+        self._status_char = resolve(STATUS_CHAR)
+        self._model_char = resolve(MODEL_CHAR)
+        self._firmware_char = resolve(FIRMWARE_CHAR)
+        self._manufacturer_char = resolve(MANUFACTURER_CHAR)
+        self._software_rev_char = resolve(SOFTWARE_REV)
+
+    def _lookup_device(self) -> BLEDevice:
+        """Return the cached BLEDevice for the current address, falling back to the last known one."""
+        return self._device_lookup(self._device.address) or self._device
+
     def _disconnected(self, _: BleakClient) -> None:
         """Disconnected callback."""
         if self._expected_disconnect:
@@ -335,8 +439,6 @@ class CometBlue:
             client = self._client
             self._expected_disconnect = True
             self._client = None
-            self._read_char = None
-            self._write_char = None
             if client and client.is_connected:
                 await client.disconnect()
 
@@ -345,10 +447,12 @@ class CometBlue:
         Signal necessity to call update() on next cycle because values need
         to be updated or last update was unsuccessfull.
         """
+        target = self._target
+        current = self._current
+        # pending values the device already reports do not need an update
         return (not self.available
-                or self._target.target_temperature is not None
-                or self._target.offset_temperature is not None
-                or self._target.status_code is not None)
+                or (not target.all_temperatures_none and not target.temperatures_match(current))
+                or (target.has_pending_status and not target.status_matches(current)))
 
     @property
     def firmware_rev(self):
@@ -464,45 +568,71 @@ class CometBlue:
         """Return True if device detected opened window"""
         return self._current.window_open
 
+    async def disconnect(self):
+        """Close the connection kept open between updates instead of waiting for the disconnect timer."""
+        if self._disconnect_timer:
+            self._disconnect_timer.cancel()
+            self._disconnect_timer = None
+        await self._execute_disconnect()
+
     async def update(self, device: BLEDevice):
         """Communicate with device, first try to write new values, then read from device"""
+        was_connected = self._client is not None and self._client.is_connected
+        try:
+            await self._update(device)
+        except BleakError:
+            # establish_connection already retries, only retry if an existing link went down
+            if not was_connected or (self._client and self._client.is_connected):
+                raise
+            # the kept-alive connection was lost in between, reconnect once and retry
+            _LOGGER.debug("%s: Connection lost during update, reconnecting", device.address)
+            await self._update(device)
+
+    async def _update(self, device: BLEDevice):
         current = self._current
         target = self._target
 
         # with self.btle_connection() as conn:
         await self._ensure_connected(device)
 
-        conn = self._client
-        device_infos = [
-            current.model,
-            current.firmware_rev,
-            current.manufacturer,
-            current.software_rev
-        ]
-        if None in device_infos:
+        read = self._client.read_gatt_char
+        write = self._client.write_gatt_char
+        # hardware information never changes, it is fetched once and stored all at once
+        if current.model is None:
             _LOGGER.debug("Fetching hardware information for device %s", self._device.address)
-            current.model = (await conn.read_gatt_char(MODEL_CHAR)).decode()
-            current.firmware_rev = (await conn.read_gatt_char(FIRMWARE_CHAR)).decode()
-            current.manufacturer = (await conn.read_gatt_char(MANUFACTURER_CHAR)).decode()
-            current.software_rev = (await conn.read_gatt_char(SOFTWARE_REV)).decode()
+            model, firmware_rev, manufacturer, software_rev = [value.decode() for value in await asyncio.gather(
+                read(self._model_char),
+                read(self._firmware_char),
+                read(self._manufacturer_char),
+                read(self._software_rev_char)
+            )]
+            current.model = model
+            current.firmware_rev = firmware_rev
+            current.manufacturer = manufacturer
+            current.software_rev = software_rev
             _LOGGER.debug("Sucessfully fetched hardware information")
 
-        if not target.all_temperatures_none:
-            await conn.write_gatt_char(TEMPERATURE_CHAR,
-                                       target.temperatures,
-                                       response=True)
-            target.clear_temperatures()
-            _LOGGER.debug("Successfully updated Temperatures for device %s", self._device.address)
-
-        if target.status_code is not None:
-            await conn.write_gatt_char(STATUS_CHAR,
-                                       target.status_code,
-                                       response=True)
-            target.status_code = None
-            _LOGGER.debug("Successfully updated status for device %s", self._device.address)
-
-        current.temperatures = await conn.read_gatt_char(TEMPERATURE_CHAR)
-        current.status_code = await conn.read_gatt_char(STATUS_CHAR)
-        current.battery_level = await conn.read_gatt_char(BATTERY_CHAR)
+        # both writes are independent, submit them together
+        writes = []
+        # skip writes if the last reading already has the requested values, a change on the device
+        # since that reading (knob, schedule) is not detected until the next poll
+        if not target.all_temperatures_none and not target.temperatures_match(current):
+            writes.append(write(self._temperature_char, target.temperatures, response=True))
+        if target.has_pending_status and not target.status_matches(current):
+            writes.append(write(self._status_char, target.status_code, response=True))
+        if writes:
+            await asyncio.gather(*writes)
+            _LOGGER.debug("Successfully updated device %s", self._device.address)
+        target.clear_temperatures()
+        target.status_code = None
+
+        temperatures, status_code, battery_level = await asyncio.gather(
+            read(self._temperature_char),
+            read(self._status_char),
+            read(self._battery_char)
+        )
+        current.temperatures = temperatures
+        current.status_code = status_code
+        current.battery_level = battery_level
         _LOGGER.debug("Successfully fetched new readings for device %s", self._device.address)
         self.available = True
@@ -9,7 +9,7 @@ import bleak
 from bleak.backends.device import BLEDevice
 from bleak.backends.scanner import AdvertisementData
 
-from cometblue import *
+from .cometblue import COMETBLUE_SERVICE
 
 _LOGGER = logging.getLogger(__name__)
 CONNECT_LOCK = asyncio.Lock()
@@ -25,6 +25,8 @@ class GetSwitchbotDevices:
         """Get switchbot devices class constructor."""
         self._interface = f"hci{interface}"
         self._adv_data: dict[str, AdvertisementData] = {}
+        self._found = asyncio.Event()
+        self._wanted_address: str | None = None
 
     def detection_callback(
         self,
@@ -33,33 +35,52 @@ class GetSwitchbotDevices:
     ) -> None:
         """Callback for device detection."""
         discovery = advertisement_data #parse_advertisement_data(device, advertisement_data)
-        #print(discovery.local_name)
-        if discovery and device.name == "Comet Blue":
-            print(device.metadata)
-            print(device.address)
-            print(discovery.service_data)
-            print(discovery.service_uuids)
-            print(discovery.manufacturer_data)
-
-            #self._adv_data[discovery.address] = discovery
+        # the scanner only reports devices advertising COMETBLUE_SERVICE
+        if discovery:
+            if _LOGGER.isEnabledFor(logging.DEBUG):
+                _LOGGER.debug(
+                    "Discovered %s %s data=%s uuids=%s mfg=%s",
+                    device.address,
+                    device.metadata,
+                    discovery.service_data,
+                    discovery.service_uuids,
+                    discovery.manufacturer_data,
+                )
+            address = device.address.lower()
+            self._adv_data[address] = discovery
+            if address == self._wanted_address:
+                self._found.set()
 
     async def discover(
-        self, retry: int = DEFAULT_RETRY_COUNT, scan_timeout: int = DEFAULT_SCAN_TIMEOUT
+        self,
+        retry: int = DEFAULT_RETRY_COUNT,
+        scan_timeout: int = DEFAULT_SCAN_TIMEOUT,
+        address: str | None = None,
     ) -> dict:
-        """Find switchbot devices and their advertisement data."""
+        """Find switchbot devices and their advertisement data.
+
+        If address is given, stop scanning as soon as that device was seen.
+        """
 
         devices = None
         devices = bleak.BleakScanner(
-            # TODO: Find new UUIDs to filter on. For example, see
-            # https://github.com/OpenWonderLabs/SwitchBotAPI-BLE/blob/4ad138bb09f0fbbfa41b152ca327a78c1d0b6ba9/devicetypes/meter.md
+            # filter in bleak/BlueZ instead of checking every advertisement in Python
+            detection_callback=self.detection_callback,
+            service_uuids=[COMETBLUE_SERVICE],
             adapter=self._interface,
         )
-        devices.register_detection_callback(self.detection_callback)
 
         async with CONNECT_LOCK:
+            self._found.clear()
+            self._wanted_address = address.lower() if address else None
             await devices.start()
-            await asyncio.sleep(scan_timeout)
+            # without an address the event is never set and the full scan_timeout is used
+            try:
+                await asyncio.wait_for(self._found.wait(), timeout=scan_timeout)
+            except asyncio.TimeoutError:
+                pass
             await devices.stop()
+            self._wanted_address = None
 
         if devices is None:
             if retry < 1:
@@ -73,7 +94,7 @@ class GetSwitchbotDevices:
                 retry,
             )
             await asyncio.sleep(DEFAULT_RETRY_TIMEOUT)
-            return await self.discover(retry - 1, scan_timeout)
+            return await self.discover(retry - 1, scan_timeout, address)
 
         return self._adv_data
 
@@ -88,7 +109,7 @@ class GetSwitchbotDevices:
         return {
             address: adv
             for address, adv in self._adv_data.items()
-            if adv.data.get("model") == model
+            if adv.local_name == model
         }
 
 
@@ -96,12 +117,10 @@ class GetSwitchbotDevices:
         self, address: str
     ) -> dict[str, AdvertisementData] | None:
         """Return data for specific device."""
-        if not self._adv_data:
-            await self.discover()
+        # keys are normalized to lower case, MacOS uses UUIDs instead of MAC addresses
+        key = address.lower()
+        if key not in self._adv_data:
+            await self.discover(address=address)
 
-        return {
-            device: adv
-            for device, adv in self._adv_data.items()
-            # MacOS uses UUIDs instead of MAC addresses
-            if adv.data.get("address") == address
-        }
+        adv = self._adv_data.get(key)
+        return {address: adv} if adv is not None else None
@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
-from setuptools import setup
+from setuptools import find_packages, setup
 
 setup(
     name='cometblue_lite',
     version='0.7.0',
-    packages=['cometblue_lite'],
+    packages=find_packages(),
+    zip_safe=False,
     python_requires='>=3.4',
-    install_requires=['bleak_retry_connector>=1.8.0', 'bleak>=0.15.1'],
+    install_requires=['bleak_retry_connector>=1.9.0', 'bleak>=0.15.1'],
     description='Module for Eurotronic Comet Blue thermostats',
     author='David Kreitschmann',
     maintainer='David Kreitschmann',